@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+#Copyright (C) 2019 Thomas Bassa
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Check each entry point's import time against a budget.
+Runs `python -X importtime -c 'import <module>'` a few times per entry point,
+takes the best cumulative time and fails if it's over budget
+or if the module pulls in a dependency it shouldn't need."""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HEAVY = ('aiohttp', 'lxml', 'cssselect', 'github')
+
+#module: (budget in ms, top-level packages it must not import)
+#Budgets are for the Raspberry Pi this runs on; use --scale for faster boxes
+BUDGETS = {
+    'constants': (20, HEAVY),
+    'trending_db': (50, HEAVY),
+    'make_feeds': (150, HEAVY),
+    'repo_data': (1500, ('aiohttp', 'cssselect')),
+    'ghtrends': (1500, ('github',)),
+    'daemon': (2500, ()),
+}
+
+def import_times(module, python=sys.executable):
+    """Return {module name: cumulative import time in us}
+    from a fresh interpreter importing module"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([python, '-X', 'importtime', '-c', 'import ' + module],
+            cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            universal_newlines=True)
+    if proc.returncode:
+        raise RuntimeError('Importing {} failed:\n{}'.format(module,
+            proc.stderr.strip().splitlines()[-1]))
+
+    times = dict()
+    for line in proc.stderr.splitlines():
+        #import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError: #the header line
+            pass
+    return times
+
+def check(module, forbidden, runs=5):
+    """Returns (best time in ms, forbidden modules imported)"""
+    best = None
+    for _ in range(runs):
+        times = import_times(module)
+        if best is None or times[module] < best:
+            best = times[module]
+    loaded = set(name.split('.')[0] for name in times)
+    return best / 1000, sorted(loaded.intersection(forbidden))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS),
+            help='entry points to check (default: all)')
+    parser.add_argument('--runs', type=int, default=5,
+            help='imports per module; the fastest is kept')
+    parser.add_argument('--scale', type=float, default=1.0,
+            help='multiply every budget by this')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        budget, forbidden = BUDGETS[module]
+        budget *= args.scale
+        try:
+            ms, bad = check(module, forbidden, args.runs)
+        except RuntimeError as e:
+            print('ERROR {}'.format(e))
+            failed = True
+            continue
+
+        ok = ms <= budget and not bad
+        failed |= not ok
+        print('{} {:<12} {:8.1f}ms / {:.0f}ms'.format(
+            'ok  ' if ok else 'FAIL', module, ms, budget))
+        if bad:
+            print('     {} imported {}'.format(module, ', '.join(bad)))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+#Copyright (C) 2019 Thomas Bassa
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#Values shared by the crawler and the feed generator.
+#Keep this stdlib-only so importing it stays cheap (see bench_startup.py)
+
+from collections import namedtuple
+
+ROOT_URL = 'https://github.com/trending'
+
+Language = namedtuple('Language', ['machine_name', 'name'])
+ALL_LANG = Language('', 'All Languages')
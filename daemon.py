@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+#Copyright (C) 2019 Thomas Bassa
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import os
+import traceback
+
+import aiohttp
+from github.GithubException import GithubException
+from requests.exceptions import RequestException
+
+from trending_db import TrendingDB, DB_PATH
+from constants import ALL_LANG
+from repo_data import RepoGatherer
+from profiling import Profiler, add_profile_args
+import ghtrends
+import make_feeds
+
+#Hours between refreshes of each period;
+#any period not listed here uses DEFAULT_INTERVAL
+DEFAULT_INTERVALS = {'daily': 4, 'weekly': 12, 'monthly': 24}
+DEFAULT_INTERVAL = 24
+#Hours between re-fetching the root page for langs/periods
+CATALOGUE_INTERVAL = 24
+
+async def main(args, prof=None):
+    intervals = dict(DEFAULT_INTERVALS)
+    intervals.update(args.interval)
+
+    tdb = TrendingDB(args.db, keep_open=True)
+    try:
+        async with aiohttp.ClientSession() as session:
+            daemon = TrendsDaemon(session, tdb, intervals,
+                    args.catalogue_interval, prof, args.post_refresh)
+            if args.once:
+                await daemon.run_once()
+            else:
+                await daemon.run_forever()
+    finally:
+        tdb.close()
+
+
+class TrendsDaemon:
+    def __init__(self, session, tdb, intervals,
+            catalogue_interval=CATALOGUE_INTERVAL, prof=None, post_refresh=None):
+        """Keeps the HTTP session, DB and language catalogue warm between runs.
+        intervals maps period machine names to hours between refreshes.
+        An enabled Profiler gets a report written after every refresh.
+        post_refresh is a shell command run after each period's feeds
+        are written, e.g. to publish them."""
+        self.prof = prof or Profiler('daemon')
+        self.post_refresh = post_refresh
+        self.session = session
+        self.tdb = tdb
+        self.gat = RepoGatherer(tdb.get_key())
+        self.intervals = intervals
+        self.catalogue_interval = catalogue_interval
+
+        self.langs = None
+        self.periods = None
+        self._catalogue_time = None
+        #period machine name -> its _run_period task, while run_forever runs
+        self._tasks = None
+        #Only one refresh at a time; they share the GH rate limit and the DB
+        self._lock = asyncio.Lock()
+
+    async def refresh_catalogue(self):
+        """Re-fetch the root page for the current langs and periods"""
+        print('Refreshing language catalogue...')
+        with self.prof.stage('catalogue'):
+            langs, periods = await ghtrends.fetch_langs_and_periods(self.session)
+            self.tdb.update_langs(langs | frozenset((ALL_LANG,)))
+            self.tdb.update_periods(periods)
+        self.langs = langs
+        self.periods = periods
+        self._catalogue_time = asyncio.get_event_loop().time()
+        if self._tasks is not None:
+            self._schedule_periods()
+
+    async def ensure_catalogue(self):
+        """Refresh the catalogue if it's missing or stale"""
+        if self.periods is None:
+            await self.refresh_catalogue()
+            return
+        age = asyncio.get_event_loop().time() - self._catalogue_time
+        if age >= self.catalogue_interval * 3600:
+            await self.refresh_catalogue()
+
+    async def refresh_period(self, period_machine_name):
+        """Scrape, gather and regenerate the feeds of a single period"""
+        async with self._lock:
+            await self.ensure_catalogue()
+            period = next((p for p in self.periods
+                if p['period_machine_name'] == period_machine_name), None)
+            if period is None:
+                print('Period {} is no longer listed; skipping'
+                        .format(period_machine_name))
+                return
+
+            print('Refreshing {}...'.format(period['period_name']))
+            jobs = ghtrends.make_jobs(self.langs, [period])
+            with self.prof.stage(period_machine_name + '-scrape'):
+                all_repos, trend_count = await ghtrends.run_jobs(
+                        jobs, self.session, self.tdb)
+            print('Found {} trending entries, {} unique repos for {}.'
+                    .format(trend_count, len(all_repos), period['period_name']))
+
+            #The limit may have reset since the last refresh;
+            #get_many_repos checks what's actually left anyway
+            self.gat.exceeded = False
+            with self.prof.stage(period_machine_name + '-gather'):
+                try:
+                    await self.gat.get_many_repos(all_repos, self.tdb)
+                except (RuntimeError, GithubException, RequestException):
+                    #Trends are already saved; still rebuild and publish the
+                    #feeds, with whatever repo data we have
+                    print('Error gathering repos for {}; continuing'
+                            .format(period['period_name']))
+                    traceback.print_exc()
+
+            #Runs on the loop thread since the kept-open DB connection lives here
+            with self.prof.stage(period_machine_name + '-feeds'):
+                make_feeds.generate_feeds(self.tdb, periods=[
+                    (period['period_machine_name'], period['period_name'])])
+            print('Refreshed {}'.format(period['period_name']))
+
+            #Still under the lock so publishes never overlap
+            await self.run_post_refresh(period_machine_name)
+
+    async def run_post_refresh(self, period_machine_name):
+        """Run the post_refresh command, if any, with GHTRENDS_PERIOD set"""
+        if not self.post_refresh:
+            return
+        print('Running post-refresh hook for {}...'.format(period_machine_name))
+        env = dict(os.environ, GHTRENDS_PERIOD=period_machine_name)
+        proc = await asyncio.create_subprocess_shell(self.post_refresh, env=env)
+        try:
+            returncode = await proc.wait()
+        except asyncio.CancelledError:
+            #Don't leave a half-done publish behind; Ctrl-C reaches it too anyway
+            print('Waiting for post-refresh hook to exit...')
+            await proc.wait()
+            raise
+        if returncode:
+            print('Post-refresh hook for {} exited with {}'
+                    .format(period_machine_name, returncode))
+
+    async def run_once(self):
+        """Refresh every period once"""
+        await self.ensure_catalogue()
+        for period in self.periods:
+            await self._safe_refresh(period['period_machine_name'])
+        print('Complete!')
+
+    async def run_forever(self):
+        """Refresh each period on its own cadence until cancelled.
+        Periods added or dropped by a catalogue refresh are (un)scheduled."""
+        self._tasks = dict()
+        try:
+            await self.ensure_catalogue()
+            self._schedule_periods()
+            await asyncio.get_event_loop().create_future() #i.e. forever
+        finally:
+            tasks = list(self._tasks.values())
+            self._tasks = None
+            for task in tasks:
+                task.cancel()
+            #Let them unwind (locks, hooks...) rather than be destroyed pending
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _schedule_periods(self):
+        listed = set(p['period_machine_name'] for p in self.periods)
+        for name in set(self._tasks) - listed:
+            #May be the task that's refreshing the catalogue right now;
+            #it'll stop at its next await
+            print('Period {} is no longer listed; unscheduling'.format(name))
+            self._tasks.pop(name).cancel()
+        for name in listed - set(self._tasks):
+            print('Scheduling {}'.format(name))
+            self._tasks[name] = asyncio.ensure_future(self._run_period(name))
+
+    async def _run_period(self, period_machine_name):
+        interval = self.intervals.get(period_machine_name, DEFAULT_INTERVAL)
+        while True:
+            await self._safe_refresh(period_machine_name)
+            print('Next {} refresh in {}h'.format(period_machine_name, interval))
+            await asyncio.sleep(interval * 3600)
+
+    async def _safe_refresh(self, period_machine_name):
+        #A bad refresh (rate limit, network...) shouldn't kill the daemon
+        try:
+            await self.refresh_period(period_machine_name)
+        except Exception:
+            print('Error refreshing {}'.format(period_machine_name))
+            traceback.print_exc()
+        finally:
+            self.prof.write_report(period_machine_name)
+
+
+def parse_interval(string):
+    """Parse PERIOD=HOURS into a (period, hours) tuple"""
+    period, sep, hours = string.partition('=')
+    try:
+        if not sep:
+            raise ValueError
+        hours = float(hours)
+        if hours <= 0:
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+                'expected PERIOD=HOURS with HOURS > 0, got {!r}'.format(string))
+    return period, hours
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Keep scraping GitHub trends and regenerating feeds.')
+    parser.add_argument('--interval', metavar='PERIOD=HOURS',
+            type=parse_interval, action='append', default=[],
+            help='hours between refreshes of PERIOD (e.g. daily=2); '
+            'defaults: {}'.format(', '.join('{}={}'.format(*i)
+                for i in DEFAULT_INTERVALS.items())))
+    parser.add_argument('--catalogue-interval', metavar='HOURS',
+            type=float, default=CATALOGUE_INTERVAL,
+            help='hours between refreshes of the language list')
+    parser.add_argument('--db', default=DB_PATH, help='path to the database')
+    parser.add_argument('--once', action='store_true',
+            help='refresh every period once, then exit')
+    parser.add_argument('--post-refresh', metavar='COMMAND',
+            help='shell command to run after each refresh writes its feeds '
+            '(e.g. ./publish_feeds.sh); the period is in $GHTRENDS_PERIOD')
+    add_profile_args(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+
+    args = parse_args()
+    prof = Profiler.from_args('daemon', args)
+    exe = ThreadPoolExecutor(4)
+    loop = asyncio.get_event_loop()
+    loop.set_default_executor(exe)
+    prof.watch_loop(loop)
+    task = asyncio.ensure_future(main(args, prof), loop=loop)
+    try:
+        loop.run_until_complete(task)
+        exe.shutdown(wait=True)
+    except KeyboardInterrupt:
+        #Cancel and wait for main so its cleanup (session, DB, tasks) runs
+        print('Stopping...')
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        exe.shutdown(wait=False)
+    except Exception:
+        print("top-level error")
+        traceback.print_exc()
+        exe.shutdown(wait=False)
+    finally:
+        loop.close()
+        prof.close()
@@ -7,9 +7,4 @@ source ./bin/activate
 python3 ./ghtrends.py &>fetch.log
 python3 ./make_feeds.py &>gen_feeds.log
 
-cp -rf feeds/ ~/trends_site/
-
-cd ~/trends_site
-git add feeds/
-git commit -m ":pager: Auto feed update @ $(date -Idate)"
-git push origin gh-pages
+./publish_feeds.sh
@@ -17,7 +17,6 @@
  
 import asyncio
 import re
-from collections import namedtuple
 from lxml import html
 import cssselect
 import aiohttp
@@ -29,9 +28,9 @@ import itertools
 import copy
 
 from trending_db import TrendingDB
-from repo_data import RepoGatherer
+from constants import ROOT_URL, Language, ALL_LANG
+from profiling import Profiler
 
-ROOT_URL = 'https://github.com/trending'
 #TODO This regex is a mess;
 #might be suited to just switching to string-split techinques instead...
 MACHINE_RE = re.compile(r'(?:https:\/\/github\.com)?(?:\/trending)?\/([^\/]*)\?.*')
@@ -39,35 +38,21 @@ MACHINE_RE = re.compile(r'(?:https:\/\/github\.com)?(?:\/trending)?\/([^\/]*)\?.
 #e.g. 'https://github.com/trending/python?since=daily' -> 'python'
 #Assumes the root page will always give us a ?since param in urls
 
-Language = namedtuple('Language', ['machine_name', 'name'])
-ALL_LANG = Language('', 'All Languages')
-
-async def main():
+async def main(prof=None):
+    prof = prof or Profiler('ghtrends')
     tdb = TrendingDB()
     async with aiohttp.ClientSession() as session:
-        #tree = await get_disk_tree()
-        tree = await get_page_tree(ROOT_URL, session)
-        loop = asyncio.get_event_loop()
-        langs, periods = await loop.run_in_executor(None, get_langs_and_periods, tree)
-
-        #languages = sorted(langs, key=operator.attrgetter('name'))
-        #pprint.pprint(languages)
-        #pprint.pprint(periods)
-
-        tdb.update_langs(langs | frozenset((ALL_LANG,)))
-        tdb.update_periods(periods)
-
-        jobs = []
-        #Use periods to construct jobs for the "all" lang
-        for period in periods:
-            job = FetchJob(ALL_LANG, period)
-            #Don't use usual contruction of URL...
-            job.url = period['all_url']
-            jobs.append(job)
-
-        #The rest of the jobs are formed from langs cross periods
-        for lang, period in itertools.product(langs, periods):
-            jobs.append(FetchJob(lang, period))
+        with prof.stage('catalogue'):
+            langs, periods = await fetch_langs_and_periods(session)
+
+            #languages = sorted(langs, key=operator.attrgetter('name'))
+            #pprint.pprint(languages)
+            #pprint.pprint(periods)
+
+            tdb.update_langs(langs | frozenset((ALL_LANG,)))
+            tdb.update_periods(periods)
+
+        jobs = make_jobs(langs, periods)
 
         #for now, cut off at 10 jobs
         #jobs = jobs[:10]
@@ -75,14 +60,8 @@ async def main():
         #pprint.pprint(list(map(operator.attrgetter('url'), jobs)))
         #await asyncio.gather(*map(operator.methodcaller('fetch', session), jobs))
 
-        task_list = [job.fetch(session) for job in jobs]
-        trend_count = 0
-        all_repos = set()
-        for fut in asyncio.as_completed(task_list):
-            job = await fut
-            tdb.insert_trends_from_job(job)
-            trend_count += len(job.repos)
-            all_repos.update(job.repos)
+        with prof.stage('scrape'):
+            all_repos, trend_count = await run_jobs(jobs, session, tdb)
 
         print('Done fetching!')
 
@@ -90,9 +69,12 @@ async def main():
     print('Found {} unique repos. Gathering...'.format(len(all_repos)))
     pprint.pprint(all_repos)
 
-    key = tdb.get_key()
-    gat = RepoGatherer(key)
-    await gat.get_many_repos(all_repos, tdb)
+    with prof.stage('gather'):
+        #Deferred so PyGithub is only loaded once we actually need it
+        from repo_data import RepoGatherer
+        key = tdb.get_key()
+        gat = RepoGatherer(key)
+        await gat.get_many_repos(all_repos, tdb)
     #summaries = await gat.get_many_repos(all_repos, tdb)
 
     #name_changes = dict(filter(None, map(operator.attrgetter('name_change'), summaries)))
@@ -102,6 +84,43 @@ async def main():
 
     print('Complete!')
 
+async def fetch_langs_and_periods(session):
+    """Fetch the root trending page and parse it
+    into a set of Language tuples and a list of Period dicts"""
+    #tree = await get_disk_tree()
+    tree = await get_page_tree(ROOT_URL, session)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, get_langs_and_periods, tree)
+
+def make_jobs(langs, periods):
+    """Build the list of FetchJobs for langs cross periods,
+    plus one job per period for the "all" lang"""
+    jobs = []
+    #Use periods to construct jobs for the "all" lang
+    for period in periods:
+        job = FetchJob(ALL_LANG, period)
+        #Don't use usual contruction of URL...
+        job.url = period['all_url']
+        jobs.append(job)
+
+    #The rest of the jobs are formed from langs cross periods
+    for lang, period in itertools.product(langs, periods):
+        jobs.append(FetchJob(lang, period))
+    return jobs
+
+async def run_jobs(jobs, session, tdb):
+    """Fetch every job, saving trends to tdb as each one completes.
+    Returns the set of repos seen and the total trending entry count."""
+    task_list = [job.fetch(session) for job in jobs]
+    trend_count = 0
+    all_repos = set()
+    for fut in asyncio.as_completed(task_list):
+        job = await fut
+        tdb.insert_trends_from_job(job)
+        trend_count += len(job.repos)
+        all_repos.update(job.repos)
+    return all_repos, trend_count
+
 
 class FetchJob:
     def __init__(self, language, period):
@@ -228,14 +247,22 @@ def _disktree():
 
 
 if __name__ == '__main__':
+    import argparse
     import traceback
     from concurrent.futures import ThreadPoolExecutor
+    from profiling import add_profile_args
+
+    parser = argparse.ArgumentParser(
+            description='Scrape GitHub trending pages and gather repo data.')
+    add_profile_args(parser)
+    prof = Profiler.from_args('ghtrends', parser.parse_args())
 
     exe = ThreadPoolExecutor(4)
     loop = asyncio.get_event_loop()
     loop.set_default_executor(exe)
+    prof.watch_loop(loop)
     try:
-        loop.run_until_complete(main())
+        loop.run_until_complete(main(prof))
         exe.shutdown(wait=True)
     except Exception:
         print("top-level error")
@@ -243,3 +270,4 @@ if __name__ == '__main__':
         exe.shutdown(wait=False)
     finally:
         loop.close()
+        prof.close()
@@ -22,57 +22,71 @@ import os
 import PyRSS2Gen
 
 from trending_db import TrendingDB
-from ghtrends import ROOT_URL
+from constants import ROOT_URL
+from profiling import Profiler
 
-def main():
+def main(prof=None):
+    prof = prof or Profiler('make_feeds')
     tdb = TrendingDB()
+    with prof.stage('feeds'):
+        generate_feeds(tdb)
+    print('Complete!')
 
-    langs = tdb.get_langs()
-    periods = tdb.get_periods()
+def generate_feeds(tdb, langs=None, periods=None):
+    """Write a feed for every lang cross period.
+    langs and periods are lists of (machine_name, name) tuples
+    as returned by TrendingDB; either defaults to everything in tdb."""
+    if langs is None:
+        langs = tdb.get_langs()
+    if periods is None:
+        periods = tdb.get_periods()
 
     for lang_t, period_t in itertools.product(langs, periods):
-        lang = lang_t[0]
-        period = period_t[0]
-        hlang = lang_t[1]
-        hperiod = period_t[1]
-        print('Generating feed for {}, {}'.format(lang, period))
-
-        out_path = 'feeds/{}'.format(period)
-        out_file = '{}/{}.xml'.format(out_path, lang)
-        if lang == '': #Patch over "all langs" being empty machine name
-            out_file = '{}/all.xml'.format(out_path)
-
-        feed = dict()
-        feed['title'] = 'GitHub Trending: {}, {}'.format(hlang, hperiod)
-        feed['link'] = '{}/{}?since={}'.format(ROOT_URL, lang, period)
-        feed['description'] = ('The top repositories on GitHub for {}, measured {}'
-                .format(lang, period))
-        feed['ttl'] = 720 #720 minutes == 12 hours; arbitrarily chosen
-
-        feed['pubDate'] = datetime.now(timezone.utc)
-        #This is probably wrong
-        feed['lastBuildDate'] = feed['pubDate']
-
-        composite = tdb.get_composite_trends(lang, period)
-        if composite:
-            feed['items'] = list(map(row_to_rss_item, composite))
-        else:
-            #TODO today's date as string
-            feed['items'] = [PyRSS2Gen.RSSItem(
-                title='No repos in {}, {} for today'.format(hlang, hperiod),
-                pubDate=datetime.utcnow()
-            )]
-
-        rss = PyRSS2Gen.RSS2(**feed)
-
-        os.makedirs(out_path, exist_ok=True)
-        rss.write_xml(open(out_file, 'w'), 'utf-8')
-        print('Generated feed for {}, {}'.format(lang, period))
-    print('Complete!')
+        write_feed(tdb, lang_t, period_t)
+
+def write_feed(tdb, lang_t, period_t):
+    """Write the feed for a single (lang, period) pair"""
+    lang = lang_t[0]
+    period = period_t[0]
+    hlang = lang_t[1]
+    hperiod = period_t[1]
+    print('Generating feed for {}, {}'.format(lang, period))
+
+    out_path = 'feeds/{}'.format(period)
+    out_file = '{}/{}.xml'.format(out_path, lang)
+    if lang == '': #Patch over "all langs" being empty machine name
+        out_file = '{}/all.xml'.format(out_path)
+
+    feed = dict()
+    feed['title'] = 'GitHub Trending: {}, {}'.format(hlang, hperiod)
+    feed['link'] = '{}/{}?since={}'.format(ROOT_URL, lang, period)
+    feed['description'] = ('The top repositories on GitHub for {}, measured {}'
+            .format(lang, period))
+    feed['ttl'] = 720 #720 minutes == 12 hours; arbitrarily chosen
+
+    feed['pubDate'] = datetime.now(timezone.utc)
+    #This is probably wrong
+    feed['lastBuildDate'] = feed['pubDate']
+
+    composite = tdb.get_composite_trends(lang, period)
+    if composite:
+        feed['items'] = list(map(row_to_rss_item, composite))
+    else:
+        #TODO today's date as string
+        feed['items'] = [PyRSS2Gen.RSSItem(
+            title='No repos in {}, {} for today'.format(hlang, hperiod),
+            pubDate=datetime.utcnow()
+        )]
+
+    rss = PyRSS2Gen.RSS2(**feed)
+
+    os.makedirs(out_path, exist_ok=True)
+    rss.write_xml(open(out_file, 'w'), 'utf-8')
+    print('Generated feed for {}, {}'.format(lang, period))
 
 def row_to_rss_item(row):
     #lang_name, period_name, rank, date,
-    #repo_name, description, readme_html, last_seen, first_seen
+    #repo_name, description, readme_html, last_seen, first_seen, readme_excerpt
     item = dict()
 
     # Use \x23 instead of '#' if .format trips on it
@@ -96,11 +110,23 @@ def row_to_rss_item(row):
     #        row_descr, row.last_seen, row.first_seen)
     descr = '<p><i>{}</i></p>'.format(row_descr)
 
-    descr += row.readme_html or '<p>No README was found for this project.</p>'
+    #Prefer the size-limited excerpt; rows gathered before it existed lack one
+    readme = row.readme_excerpt or row.readme_html
+    descr += readme or '<p>No README was found for this project.</p>'
     item['description'] = descr
 
     return PyRSS2Gen.RSSItem(**item)
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+    from profiling import add_profile_args
+
+    parser = argparse.ArgumentParser(
+            description='Generate RSS feeds from the trends database.')
+    add_profile_args(parser, event_loop=False)
+    prof = Profiler.from_args('make_feeds', parser.parse_args())
+    try:
+        main(prof)
+    finally:
+        prof.close()
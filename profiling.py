@@ -0,0 +1,221 @@
+#Copyright (C) 2019 Thomas Bassa
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#Opt-in CPU/memory profiling for the entry points.
+#Everything heavier than the stdlib basics is imported only when enabled,
+#so make_feeds can import this without blowing its startup budget.
+
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+import os
+import time
+
+PROFILE_DIR = 'profile'
+#How many allocation sites/functions to list per stage in the summary
+TOP_N = 15
+
+StageResult = namedtuple('StageResult',
+        ['name', 'seconds', 'overhead', 'peak_bytes', 'top_allocs', 'profile'])
+
+def add_profile_args(parser, event_loop=True):
+    """Add the profiling options to an argparse parser.
+    --slow-callback is only offered if event_loop is set."""
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', action='store_true',
+            help='run each stage under cProfile (main thread only)')
+    group.add_argument('--trace-malloc', action='store_true',
+            help='trace allocations with tracemalloc; '
+            'reports peak memory and top allocation sites per stage')
+    if event_loop:
+        group.add_argument('--slow-callback', metavar='SECONDS', type=float,
+                help='report event loop callbacks slower than this '
+                '(puts the loop in debug mode)')
+    group.add_argument('--profile-dir', default=PROFILE_DIR,
+            help='where to write .pstats files and the summary report')
+
+
+class Profiler:
+    def __init__(self, name, cpu=False, memory=False,
+            out_dir=PROFILE_DIR, slow_callback=None):
+        """Profiles named stages of an entry point called name.
+        slow_callback is a threshold in seconds, or None to not watch the loop.
+        With none of cpu, memory or slow_callback set, every method is a no-op."""
+        self.name = name
+        self.cpu = cpu
+        self.memory = memory
+        self.out_dir = out_dir
+        self.slow_callback = slow_callback
+
+        self.stages = []
+        self._slow_log = None
+        self._reports = 0
+
+    @classmethod
+    def from_args(cls, name, args):
+        """Create a Profiler from args parsed with add_profile_args"""
+        return cls(name, args.profile, args.trace_malloc,
+                args.profile_dir, getattr(args, 'slow_callback', None))
+
+    @property
+    def enabled(self):
+        return self.cpu or self.memory or self.slow_callback is not None
+
+    def watch_loop(self, loop):
+        """Report event loop callbacks that take longer than slow_callback"""
+        if self.slow_callback is None or self._slow_log is not None:
+            return
+        import logging
+
+        self._slow_log = _make_slow_log_handler()
+        #asyncio logs "Executing <Handle ...> took 1.234 seconds" as a warning
+        logging.getLogger('asyncio').addHandler(self._slow_log)
+        loop.slow_callback_duration = self.slow_callback
+        loop.set_debug(True)
+
+    @contextmanager
+    def stage(self, stage_name):
+        """Context manager profiling everything run inside it as stage_name.
+        Stages shouldn't be nested; only one cProfile can be active at a time."""
+        if not self.enabled:
+            yield
+            return
+
+        prof = None
+        before = None
+        setup = time.perf_counter()
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            before = _take_snapshot()
+            tracemalloc.reset_peak()
+        if self.cpu:
+            import cProfile
+            prof = cProfile.Profile()
+            prof.enable()
+        #Stage time excludes the snapshots; they're reported as overhead
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if prof is not None:
+                prof.disable()
+            peak = None
+            top = []
+            if before is not None:
+                peak = tracemalloc.get_traced_memory()[1]
+                top = _take_snapshot().compare_to(before, 'lineno')[:TOP_N]
+            overhead = (start - setup) + (time.perf_counter() - end)
+            self.stages.append(StageResult(stage_name, end - start, overhead,
+                peak, top, prof))
+
+    def write_report(self, label=None):
+        """Write a .pstats file per stage plus a summary of every stage,
+        then start over (so the daemon can report once per refresh).
+        label is added to the file names, e.g. the daemon's period.
+        Returns the path of the summary, or None if there was nothing to write."""
+        if not self.enabled or not self.stages:
+            return None
+        import pstats
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        #Several reports can land in the same second; count them to keep them apart
+        self._reports += 1
+        name = '-'.join(filter(None, (self.name, label, stamp,
+            str(self._reports))))
+        prefix = os.path.join(self.out_dir, name)
+        summary = prefix + '-summary.txt'
+
+        with open(summary, 'w') as f:
+            f.write('{} profile @ {}\n'.format(self.name, stamp))
+            for result in self.stages:
+                f.write('\n== {0.name}: {0.seconds:.3f}s'.format(result))
+                if result.overhead >= 0.001:
+                    f.write(' (+{:.3f}s profiler overhead)'.format(result.overhead))
+                if result.peak_bytes is not None:
+                    f.write(', peak {:.1f} KiB'.format(result.peak_bytes / 1024))
+                f.write(' ==\n')
+
+                if result.top_allocs:
+                    f.write('Top allocation sites (growth during stage):\n')
+                    for stat in result.top_allocs:
+                        f.write('  {}\n'.format(stat))
+
+                if result.profile is not None:
+                    stats_path = '{}-{}.pstats'.format(prefix, result.name)
+                    result.profile.dump_stats(stats_path)
+                    f.write('Top functions by cumulative time ({}):\n'
+                            .format(stats_path))
+                    stats = pstats.Stats(result.profile, stream=f)
+                    stats.sort_stats('cumulative').print_stats(TOP_N)
+
+            if self._slow_log is not None:
+                f.write('\n== Slow event loop callbacks (> {}s): {} ==\n'
+                        .format(self.slow_callback, len(self._slow_log.messages)))
+                if self.memory:
+                    f.write('Note: tracemalloc snapshots are taken on the loop '
+                            'at stage boundaries; callbacks running then '
+                            'include the overhead listed above.\n')
+                for message in self._slow_log.messages:
+                    f.write('  {}\n'.format(message))
+                self._slow_log.messages = []
+
+        self.stages = []
+        print('Wrote profile summary to {}'.format(summary))
+        return summary
+
+    def close(self):
+        """Write any outstanding report and stop tracing"""
+        self.write_report()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.stop()
+
+
+def _take_snapshot():
+    """Snapshot traced memory, leaving out the profiling machinery itself"""
+    import tracemalloc
+    import cProfile
+    import profile
+    import pstats
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, profile.__file__),
+        tracemalloc.Filter(False, pstats.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib.*>'),
+    ))
+
+
+def _make_slow_log_handler():
+    #Defined lazily so logging is only imported when watching a loop
+    import logging
+
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__(logging.WARNING)
+            self.messages = []
+
+        def emit(self, record):
+            message = record.getMessage()
+            if message.startswith('Executing '):
+                self.messages.append(message)
+
+    return ListHandler()
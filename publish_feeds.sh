@@ -0,0 +1,11 @@
+#!/bin/bash
+
+set -e
+
+cd ~/ghtrends
+cp -rf feeds/ ~/trends_site/
+
+cd ~/trends_site
+git add feeds/
+git commit -m ":pager: Auto feed update @ $(date -Idate)"
+git push origin gh-pages
@@ -0,0 +1,182 @@
+#Copyright (C) 2019 Thomas Bassa
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#Cleans up README html once when it's gathered,
+#so make_feeds can paste it into every feed as-is
+
+import copy
+from urllib.parse import urljoin
+
+from lxml import etree, html
+
+GH_URL = 'https://github.com'
+RAW_URL = 'https://raw.githubusercontent.com'
+
+#Roughly how many characters of html to put in a feed item
+EXCERPT_BUDGET = 8000
+#Tables with more rows than this are replaced with a link
+MAX_TABLE_ROWS = 50
+#Never useful in a feed reader; inline svg in particular can be huge
+_DROP_TAGS = ('svg', 'script', 'style')
+#Don't bother trimming a block to fit in less room than this, unless it's the first
+_MIN_TRIM = 200
+
+def normalize_readme(readme_html, repo_name, branch='master'):
+    """Rewrite relative links and images in readme_html to absolute urls
+    and strip heavy elements (inline svg, data: images, huge tables).
+    Returns a tuple of (full html, excerpt html), where the excerpt
+    is cut down to roughly EXCERPT_BUDGET characters.
+    Both are '' if there's nothing left to show."""
+    try:
+        root = html.fragment_fromstring(readme_html, create_parent='div')
+    except (etree.ParserError, ValueError):
+        #Not something lxml can handle; better to keep it as-is than lose it
+        return readme_html, readme_html
+
+    repo_url = '{}/{}'.format(GH_URL, repo_name)
+    _make_urls_absolute(root, repo_name, branch)
+    _strip_heavy(root, repo_url)
+    if len(root) == 0 and not (root.text or '').strip():
+        return '', ''
+
+    full = html.tostring(root, encoding='unicode')
+    return full, _excerpt(root, full, repo_url)
+
+def _make_urls_absolute(root, repo_name, branch):
+    repo_url = '{}/{}'.format(GH_URL, repo_name)
+    #Links point at the rendered file, images at the raw file
+    blob_base = '{}/blob/{}/'.format(repo_url, branch)
+    raw_base = '{}/{}/{}/'.format(RAW_URL, repo_name, branch)
+
+    for a in root.iter('a'):
+        href = a.get('href')
+        if not href:
+            continue
+        if href.startswith('#'):
+            a.set('href', repo_url + href)
+        else:
+            a.set('href', urljoin(blob_base, href))
+
+    def image_url(src):
+        if src.startswith('data:'):
+            return src
+        if src.startswith('/'): #e.g. /user/repo/raw/master/img.png
+            return urljoin(GH_URL, src)
+        return urljoin(raw_base, src)
+
+    #<source> covers <picture> (e.g. light/dark logos) and <video>
+    for img in root.iter('img', 'source'):
+        src = img.get('src')
+        if src:
+            img.set('src', image_url(src))
+        srcset = img.get('srcset')
+        if srcset:
+            img.set('srcset', _map_srcset(srcset, image_url))
+
+def _map_srcset(srcset, func):
+    """Apply func to each url in a srcset like 'a.png 1x, b.png 2x'"""
+    candidates = []
+    for candidate in srcset.split(','):
+        parts = candidate.split(None, 1)
+        if parts:
+            parts[0] = func(parts[0])
+            candidates.append(' '.join(parts))
+    return ', '.join(candidates)
+
+def _strip_heavy(root, repo_url):
+    #Materialize the lists; we can't modify the tree while iterating it
+    for el in list(root.iter(*_DROP_TAGS)):
+        el.drop_tree()
+
+    for img in list(root.iter('img')):
+        if (img.get('src') or '').startswith('data:'):
+            img.drop_tree()
+
+    for table in list(root.iter('table')):
+        if len(table.xpath('.//tr')) > MAX_TABLE_ROWS:
+            note = html.fragment_fromstring(
+                    '<p><i><a href="{}#readme">[Large table omitted; '
+                    'see the README on GitHub]</a></i></p>'.format(repo_url))
+            note.tail = table.tail
+            table.getparent().replace(table, note)
+
+def _content_root(root):
+    """GitHub wraps the README in a div and an article;
+    dig down to the element actually holding the content"""
+    node = root
+    while (len(node) == 1 and node[0].tag in ('div', 'article')
+            and not (node.text or '').strip()
+            and not (node[0].tail or '').strip()):
+        node = node[0]
+    return node
+
+def _excerpt(root, full, repo_url):
+    if len(full) <= EXCERPT_BUDGET:
+        return full
+
+    excerpt = html.Element('div')
+    _fill(excerpt, _content_root(root), EXCERPT_BUDGET)
+
+    more = html.fragment_fromstring(
+            '<p><a href="{}#readme">Read the full README on GitHub</a></p>'
+            .format(repo_url))
+    excerpt.append(more)
+    return html.tostring(excerpt, encoding='unicode')
+
+def _fill(dest, src, budget):
+    """Copy src's children into dest until they'd go over budget.
+    The first child that doesn't fit is trimmed down to fill the rest,
+    so a big header or code block up front doesn't leave the excerpt empty;
+    ones that can't be trimmed are skipped until something has been copied.
+    Returns roughly how many characters were used."""
+    dest.text = (src.text or '')[:budget]
+    used = len(dest.text)
+    for child in src:
+        #tostring includes the tail text, so nothing gets lost in between
+        size = len(html.tostring(child, encoding='unicode'))
+        if used + size <= budget:
+            dest.append(copy.deepcopy(child))
+            used += size
+            continue
+        room = budget - used
+        if len(dest) == 0 or room >= _MIN_TRIM:
+            trimmed = _trim_into(dest, child, room)
+            if trimmed is None and len(dest) == 0:
+                continue #Nothing to show yet; see if the next one fits
+            used += trimmed or 0
+        break
+    return used
+
+def _trim_into(dest, el, budget):
+    """Append a copy of el to dest, cut down to about budget characters.
+    Returns the characters used, or None if el can't be cut down to fit
+    (comments, void elements like <img>, or attributes alone over budget)."""
+    #Comments' tags aren't strings; there's nothing in them worth trimming
+    if not isinstance(el.tag, str) or el.tag in html.defs.empty_tags:
+        return None
+    trimmed = html.Element(el.tag, attrib=dict(el.attrib))
+    #The tags and attributes count against the budget too
+    budget -= len(html.tostring(trimmed, encoding='unicode'))
+    if budget <= 0:
+        return None
+
+    if len(el):
+        _fill(trimmed, el, budget)
+        if len(trimmed) == 0 and not (trimmed.text or '').strip():
+            return None #None of its children could be cut down either
+    else:
+        trimmed.text = (el.text or '')[:budget] + '\u2026'
+    dest.append(trimmed)
+    return len(html.tostring(trimmed, encoding='unicode'))
@@ -29,8 +29,12 @@ from github.GithubException import UnknownObjectException, RateLimitExceededExce
 import github
 from github.Repository import Repository
 
+from readme_filter import normalize_readme
+from profiling import Profiler
+
 RepoSummary = namedtuple('RepoSummary',
-        ['repo_name', 'description', 'readme_html', 'name_change'])
+        ['repo_name', 'description', 'readme_html', 'name_change',
+        'readme_excerpt'])
 
 #via the python docs for itertools
 def grouper(iterable, n, fillvalue=None):
@@ -139,14 +143,17 @@ class RepoGatherer:
                 #proper api method-- "raw-ish" text
                 #readme = repo.get_readme().decoded_content
                 html_readme = self._clean_nonprinting(repo.get_html_readme())
+                #Do the html work once here rather than on every feed render
+                html_readme, excerpt = normalize_readme(
+                        html_readme, name, repo.default_branch)
             except UnknownObjectException:
-                html_readme = self._NO_README_HTML
+                html_readme = excerpt = self._NO_README_HTML
         except RateLimitExceededException:
             self.exceeded = True
             raise RuntimeError('Rate limit exceeded!')
 
         print('Done gathering {}'.format(repo_in))
-        return RepoSummary(name, descr, html_readme, name_change)
+        return RepoSummary(name, descr, html_readme, name_change, excerpt)
 
     _CLEAN_RE = re.compile(r'[\x0E-\x1F\x7F]')
     @staticmethod
@@ -156,7 +163,8 @@ class RepoGatherer:
         return RepoGatherer._CLEAN_RE.sub('', string)
 
 
-async def main():
+async def main(prof=None):
+    prof = prof or Profiler('repo_data')
     #import sys
     from trending_db import TrendingDB
     #if len(sys.argv) < 2:
@@ -177,7 +185,8 @@ async def main():
     gat = RepoGatherer(key)
 
     try:
-        await gat.get_many_repos(all_repos, tdb)
+        with prof.stage('gather'):
+            await gat.get_many_repos(all_repos, tdb)
         #summaries = await gat.get_many_repos(all_repos)
         #print('Got data for {} repos. Saving...'.format(len(summaries)))
         #for summary in summaries:
@@ -189,13 +198,21 @@ async def main():
 
 
 if __name__ == '__main__':
+    import argparse
     from concurrent.futures import ThreadPoolExecutor
+    from profiling import add_profile_args
+
+    parser = argparse.ArgumentParser(
+            description='Gather data for repos missing a description or README.')
+    add_profile_args(parser)
+    prof = Profiler.from_args('repo_data', parser.parse_args())
 
     exe = ThreadPoolExecutor(4)
     loop = asyncio.get_event_loop()
     loop.set_default_executor(exe)
+    prof.watch_loop(loop)
     try:
-        loop.run_until_complete(main())
+        loop.run_until_complete(main(prof))
         exe.shutdown(wait=True)
     except Exception:
         print("top-level error")
@@ -203,3 +220,4 @@ if __name__ == '__main__':
         exe.shutdown(wait=False)
     finally:
         loop.close()
+        prof.close()
@@ -17,21 +17,52 @@
 
 from collections import namedtuple
 import operator
-import pprint
 import sqlite3
 
 DB_PATH = 'GHTrends.db'
 
 CompositeTrend = namedtuple('CompositeTrend',
             ['lang_name', 'period_name', 'rank', 'date', 'repo_name',
-            'description', 'readme_html', 'last_seen', 'first_seen'])
+            'description', 'readme_html', 'last_seen', 'first_seen',
+            'readme_excerpt'])
 
 class TrendingDB:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, keep_open=False):
+        """keep_open reuses one connection for the life of this object
+        (e.g. for the daemon) instead of connecting on every call.
+        That connection may only be used from the thread that opened it."""
         self.path = db_path
+        self.keep_open = keep_open
+        self._db = None
+        self._schema_checked = False
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        db = sqlite3.connect(self.path)
+        if not self._schema_checked:
+            self._upgrade_schema(db)
+            self._schema_checked = True
+        if self.keep_open:
+            self._db = db
+        return db
+
+    def _upgrade_schema(self, db):
+        """Add any columns that are newer than the DB being opened"""
+        columns = [row[1] for row in db.execute('PRAGMA table_info(Repos)')]
+        #No columns means no table yet, i.e. create_new_db is about to run
+        if columns and 'readme_excerpt' not in columns:
+            db.execute('ALTER TABLE Repos ADD COLUMN readme_excerpt TEXT')
+            db.commit()
+            print('Added readme_excerpt to {}'.format(self.path))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
 
     def create_new_db(self):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.executescript('''\
 CREATE TABLE Languages(
@@ -43,7 +74,8 @@ CREATE TABLE Repos(
     description TEXT,
     readme_html TEXT,
     last_seen TEXT NOT NULL DEFAULT CURRENT_DATE,
-    first_seen TEXT NOT NULL DEFAULT CURRENT_DATE);
+    first_seen TEXT NOT NULL DEFAULT CURRENT_DATE,
+    readme_excerpt TEXT);
 CREATE TABLE Trends(
     lang_machine_name TEXT NOT NULL REFERENCES Languages(lang_machine_name) ON UPDATE CASCADE,
     period_machine_name TEXT NOT NULL REFERENCES Periods(period_machine_name) ON UPDATE CASCADE,
@@ -58,25 +90,25 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
     def set_key(self, key):
         #Just hardcoding 0 as id since I only expect storing 1 value here...
         k = (0, key)
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('INSERT OR REPLACE INTO GHKey VALUES (?, ?)', k)
             db.commit()
 
     def get_key(self):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('SELECT key from GHKey WHERE id = 0')
             return str(c.fetchone()[0])
 
     def update_langs(self, langs):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.executemany('INSERT OR REPLACE INTO Languages VALUES (?, ?)', langs)
             db.commit()
 
     def get_langs(self):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('SELECT * FROM Languages')
             return c.fetchall()
@@ -84,13 +116,13 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
     #TODO Should we also save the period suffix?
     def update_periods(self, periods):
         name_pairs = map(lambda p: (p['period_machine_name'], p['period_name']), periods)
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.executemany('INSERT OR REPLACE INTO Periods VALUES (?, ?)', name_pairs)
             db.commit()
 
     def get_periods(self):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('SELECT * FROM Periods')
             return c.fetchall()
@@ -102,11 +134,18 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
             rp[1],
             rp[0] + 1
             ), enumerate(fetchjob.repos))
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('PRAGMA foreign_keys = ON')
             c.executemany('INSERT OR IGNORE INTO Repos '
                     '(repo_name) VALUES (?)', ((e,) for e in fetchjob.repos))
+            #A repeat fetch on the same day may return fewer repos;
+            #drop today's old ranks so they don't linger in the feed.
+            #An empty result usually means the fetch failed, so keep those.
+            if fetchjob.repos:
+                c.execute('DELETE FROM Trends WHERE lang_machine_name=? '
+                        'AND period_machine_name=? AND date=CURRENT_DATE',
+                        (fetchjob.lang_machine_name, fetchjob.period_machine_name))
             c.executemany('INSERT OR REPLACE INTO Trends'
                     '(lang_machine_name, period_machine_name, repo_name, rank) '
                     'VALUES (?, ?, ?, ?)', trends)
@@ -114,7 +153,7 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
 
     def get_blanked_repos(self):
         #Might be temporary for the sake of testing repo_data...
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('SELECT repo_name FROM Repos '
                     'WHERE description IS NULL or readme_html IS NULL')
@@ -125,7 +164,7 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
         #so we have to check whether to insert or update...
         if repo_summary.name_change:
             #TODO do we need 2 connects + commits? Doing this for "safety" reasons
-            with sqlite3.connect(self.path) as db:
+            with self._connect() as db:
                 c = db.cursor()
                 c.execute('PRAGMA foreign_keys = ON')
                 #Update (old, new) --reverse the tuple for sql order
@@ -134,7 +173,7 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
                 db.commit()
             print('Updated repo name {}->{}'.format(*repo_summary.name_change))
 
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('PRAGMA foreign_keys = ON')
             c.execute('SELECT count(*) FROM Repos WHERE repo_name=?',
@@ -142,23 +181,26 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
             #if present (count != 0), update
             if int(c.fetchone()[0]): 
                 c.execute('UPDATE Repos SET '
-                        'description=?, readme_html=?, last_seen=CURRENT_DATE '
-                        'WHERE repo_name=?',
+                        'description=?, readme_html=?, readme_excerpt=?, '
+                        'last_seen=CURRENT_DATE WHERE repo_name=?',
                         (repo_summary.description, repo_summary.readme_html,
-                            repo_summary.repo_name))
+                            repo_summary.readme_excerpt, repo_summary.repo_name))
                 print('Updated {}'.format(repo_summary.repo_name))
             else:
                 #otherwise insert
-                c.execute('INSERT INTO Repos(repo_name, description, readme_html) '
-                        'VALUES (?, ?, ?) ', repo_summary[:3])
+                c.execute('INSERT INTO Repos(repo_name, description, '
+                        'readme_html, readme_excerpt) VALUES (?, ?, ?, ?) ',
+                        (repo_summary.repo_name, repo_summary.description,
+                            repo_summary.readme_html, repo_summary.readme_excerpt))
                 print('Saved {}'.format(repo_summary.repo_name))
             db.commit()
 
     def get_composite_trends(self, lang, period):
-        with sqlite3.connect(self.path) as db:
+        with self._connect() as db:
             c = db.cursor()
             c.execute('SELECT lang_name, period_name, rank, date, repo_name, '
-                    'description, readme_html, last_seen, first_seen FROM '
+                    'description, readme_html, last_seen, first_seen, '
+                    'readme_excerpt FROM '
                     'Trends NATURAL JOIN Repos NATURAL JOIN Languages '
                     'NATURAL JOIN Periods '
                     'WHERE lang_machine_name=? AND period_machine_name=? '
@@ -169,6 +211,7 @@ CREATE TABLE GHKey(id INTEGER PRIMARY KEY, key TEXT NOT NULL);''')
 
 def main():
     import os
+    import pprint
     tdb = TrendingDB()
     if not os.path.exists(tdb.path):
         tdb.create_new_db()